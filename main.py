@@ -2,9 +2,13 @@ from fastmcp import FastMCP
 import os
 import sqlite3
 import json
-from datetime import datetime, timedelta
-from collections import defaultdict
-import calendar
+import re
+import csv
+import io
+import atexit
+import threading
+import time
+from contextlib import contextmanager
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "expenses.db")
 CATEGORIES_PATH = os.path.join(os.path.dirname(__file__), "categories.json")
@@ -12,8 +16,73 @@ BUDGETS_PATH = os.path.join(os.path.dirname(__file__), "budgets.json")
 
 mcp = FastMCP("ExpenseTracker")
 
+# Single shared connection, opened once in init_db(). isolation_level=None puts
+# the driver in autocommit mode; multi-statement writes use BEGIN IMMEDIATE.
+CONN = None
+_db_lock = threading.Lock()
+
+@contextmanager
+def _transaction(c):
+    '''Run a block of writes as a single BEGIN IMMEDIATE ... COMMIT transaction.'''
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        yield c
+        c.execute("COMMIT")
+    except BaseException:
+        # A failed COMMIT may already have rolled back; never leave CONN mid-transaction
+        if c.in_transaction:
+            c.execute("ROLLBACK")
+        raise
+
+def _split_tags(tags):
+    '''Split a comma-separated tags string into distinct, trimmed tag names.'''
+    distinct = {}
+    for tag in (tags or "").split(","):
+        tag = tag.strip()
+        if tag:
+            distinct.setdefault(tag.lower(), tag)
+    return list(distinct.values())
+
+def _set_expense_tags(c, expense_id, tags):
+    '''Replace the expense_tags rows of one expense with the tags from a comma-separated string.'''
+    c.execute("DELETE FROM expense_tags WHERE expense_id = ?", (expense_id,))
+    c.executemany(
+        "INSERT OR IGNORE INTO expense_tags(expense_id, tag) VALUES (?, ?)",
+        [(expense_id, tag) for tag in _split_tags(tags)]
+    )
+
+_MONTH_RE = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+def _invalid_month(month):
+    '''Return True unless month is a YYYY-MM string that SQLite date math can use.'''
+    return not isinstance(month, str) or not _MONTH_RE.fullmatch(month)
+
+# [monotonic timestamp, "YYYY-MM-DD"] of the last local-date lookup
+_today_cache = [float("-inf"), ""]
+
+def _today_str():
+    '''Return today's local date as YYYY-MM-DD, reformatting it at most once per second.'''
+    now = time.monotonic()
+    if now - _today_cache[0] >= 1.0:
+        _today_cache[:] = (now, time.strftime("%Y-%m-%d"))
+    return _today_cache[1]
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as c:
+    global CONN
+    CONN = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    CONN.row_factory = sqlite3.Row
+    # page_size only takes effect on a new database, so it must precede the first write
+    CONN.execute("PRAGMA page_size=8192")
+    CONN.execute("PRAGMA journal_mode=WAL")
+    CONN.execute("PRAGMA synchronous=NORMAL")
+    CONN.execute("PRAGMA temp_store=MEMORY")
+    CONN.execute("PRAGMA cache_size=-64000")
+    # Read pages through a 256 MiB memory map instead of read() for analytics scans
+    CONN.execute("PRAGMA mmap_size=268435456")
+    atexit.register(CONN.close)
+
+    with _db_lock:
+        c = CONN
         # Main expenses table
         c.execute("""
             CREATE TABLE IF NOT EXISTS expenses(
@@ -31,6 +100,19 @@ def init_db():
             )
         """)
         
+        # Databases created by older versions lack the extended expense columns.
+        # ALTER TABLE cannot add a CURRENT_TIMESTAMP default, so created_at stays NULL there.
+        existing_columns = {row["name"] for row in c.execute("PRAGMA table_info(expenses)")}
+        for column, definition in (
+            ("payment_method", "TEXT DEFAULT ''"),
+            ("location", "TEXT DEFAULT ''"),
+            ("recurring_id", "INTEGER DEFAULT NULL"),
+            ("tags", "TEXT DEFAULT ''"),
+            ("created_at", "TIMESTAMP"),
+        ):
+            if column not in existing_columns:
+                c.execute(f"ALTER TABLE expenses ADD COLUMN {column} {definition}")
+        
         # Recurring expenses template table
         c.execute("""
             CREATE TABLE IF NOT EXISTS recurring_expenses(
@@ -60,6 +142,79 @@ def init_db():
             )
         """)
 
+        # Indexes for the date-range filters used by listing and analytics.
+        # (category, date, amount) also covers per-category SUM(amount) lookups.
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_cat_date_amount ON expenses(category, date, amount)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_income_date ON income(date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rec_due_active ON recurring_expenses(next_due_date, active)")
+
+        # Full-text index over the searchable expense fields, kept in sync by triggers.
+        # One transaction covers check, CREATE and rebuild, so a crash cannot leave an
+        # empty FTS table that later starts would skip.
+        with _transaction(c):
+            fts_exists = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+            ).fetchone()
+            c.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+                    note, category, subcategory, location, tags,
+                    content='expenses', content_rowid='id'
+                )
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS expenses_fts_ai AFTER INSERT ON expenses BEGIN
+                    INSERT INTO expenses_fts(rowid, note, category, subcategory, location, tags)
+                    VALUES (new.id, new.note, new.category, new.subcategory, new.location, new.tags);
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS expenses_fts_ad AFTER DELETE ON expenses BEGIN
+                    INSERT INTO expenses_fts(expenses_fts, rowid, note, category, subcategory, location, tags)
+                    VALUES ('delete', old.id, old.note, old.category, old.subcategory, old.location, old.tags);
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS expenses_fts_au
+                AFTER UPDATE OF note, category, subcategory, location, tags ON expenses BEGIN
+                    INSERT INTO expenses_fts(expenses_fts, rowid, note, category, subcategory, location, tags)
+                    VALUES ('delete', old.id, old.note, old.category, old.subcategory, old.location, old.tags);
+                    INSERT INTO expenses_fts(rowid, note, category, subcategory, location, tags)
+                    VALUES (new.id, new.note, new.category, new.subcategory, new.location, new.tags);
+                END
+            """)
+            if not fts_exists:
+                # Index expenses that were recorded before the FTS table existed
+                c.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')")
+
+        # One row per (tag, expense); the tags column stays as the display copy.
+        # As with expenses_fts, check, CREATE and migration share one transaction.
+        with _transaction(c):
+            tags_exist = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_tags'"
+            ).fetchone()
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS expense_tags(
+                    expense_id INTEGER NOT NULL,
+                    tag TEXT NOT NULL COLLATE NOCASE,
+                    PRIMARY KEY(tag, expense_id)
+                ) WITHOUT ROWID
+            """)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_expense_tags_expense ON expense_tags(expense_id)")
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS expense_tags_ad AFTER DELETE ON expenses BEGIN
+                    DELETE FROM expense_tags WHERE expense_id = old.id;
+                END
+            """)
+            if not tags_exist:
+                # Migrate the comma-separated tags of existing expenses
+                c.executemany(
+                    "INSERT OR IGNORE INTO expense_tags(expense_id, tag) VALUES (?, ?)",
+                    [(row["id"], tag)
+                     for row in c.execute("SELECT id, tags FROM expenses WHERE tags != ''").fetchall()
+                     for tag in _split_tags(row["tags"])]
+                )
+
 init_db()
 
 # ============== BASIC EXPENSE OPERATIONS ==============
@@ -67,76 +222,81 @@ init_db()
 @mcp.tool()
 def add_expense(date, amount, category, subcategory="", note="", payment_method="", location="", tags=""):
     '''Add a new expense entry to the database with enhanced fields.'''
-    with sqlite3.connect(DB_PATH) as c:
-        cur = c.execute(
-            """INSERT INTO expenses(date, amount, category, subcategory, note, payment_method, location, tags) 
-               VALUES (?,?,?,?,?,?,?,?)""",
-            (date, amount, category, subcategory, note, payment_method, location, tags)
-        )
-        return {"status": "ok", "id": cur.lastrowid, "message": f"Added expense of ${amount} for {category}"}
+    with _db_lock:
+        c = CONN
+        with _transaction(c):
+            [row] = c.execute(
+                """INSERT INTO expenses(date, amount, category, subcategory, note, payment_method, location, tags) 
+                   VALUES (?,?,?,?,?,?,?,?) RETURNING id""",
+                (date, amount, category, subcategory, note, payment_method, location, tags)
+            ).fetchall()
+            _set_expense_tags(c, row["id"], tags)
+        return {"status": "ok", "id": row["id"], "message": f"Added expense of ${amount} for {category}"}
+
+_UPDATE_FIELDS = ("date", "amount", "category", "subcategory", "note", "payment_method", "location", "tags")
+# tuple of columns being set -> UPDATE statement, filled in on first use
+_UPDATE_SQL = {}
+
+def _update_expense_sql(columns):
+    '''Return the UPDATE statement that sets the given columns of one expense.'''
+    query = _UPDATE_SQL.get(columns)
+    if query is None:
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        query = _UPDATE_SQL[columns] = f"UPDATE expenses SET {assignments} WHERE id = ? RETURNING id"
+    return query
 
 @mcp.tool()
 def update_expense(expense_id, date=None, amount=None, category=None, subcategory=None, 
                    note=None, payment_method=None, location=None, tags=None):
     '''Update an existing expense entry.'''
-    with sqlite3.connect(DB_PATH) as c:
-        # First check if expense exists
-        existing = c.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,)).fetchone()
-        if not existing:
+    values = dict(zip(_UPDATE_FIELDS, (date, amount, category, subcategory, note, payment_method, location, tags)))
+    columns = tuple(field for field in _UPDATE_FIELDS if values[field] is not None)
+    if not columns:
+        return {"status": "error", "message": "No fields to update"}
+    
+    params = [values[column] for column in columns]
+    params.append(expense_id)
+    with _db_lock:
+        c = CONN
+        with _transaction(c):
+            found = c.execute(_update_expense_sql(columns), params).fetchall()
+            if found and tags is not None:
+                _set_expense_tags(c, expense_id, tags)
+        
+        # No returned row means the expense does not exist
+        if not found:
             return {"status": "error", "message": f"Expense with ID {expense_id} not found"}
         
-        # Build update query dynamically
-        updates = []
-        params = []
-        
-        if date is not None:
-            updates.append("date = ?")
-            params.append(date)
-        if amount is not None:
-            updates.append("amount = ?")
-            params.append(amount)
-        if category is not None:
-            updates.append("category = ?")
-            params.append(category)
-        if subcategory is not None:
-            updates.append("subcategory = ?")
-            params.append(subcategory)
-        if note is not None:
-            updates.append("note = ?")
-            params.append(note)
-        if payment_method is not None:
-            updates.append("payment_method = ?")
-            params.append(payment_method)
-        if location is not None:
-            updates.append("location = ?")
-            params.append(location)
-        if tags is not None:
-            updates.append("tags = ?")
-            params.append(tags)
-        
-        if not updates:
-            return {"status": "error", "message": "No fields to update"}
-        
-        params.append(expense_id)
-        query = f"UPDATE expenses SET {', '.join(updates)} WHERE id = ?"
-        c.execute(query, params)
-        
         return {"status": "ok", "message": f"Updated expense ID {expense_id}"}
 
 @mcp.tool()
 def delete_expense(expense_id):
     '''Delete an expense entry by ID.'''
-    with sqlite3.connect(DB_PATH) as c:
+    with _db_lock:
+        c = CONN
         cur = c.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
         if cur.rowcount > 0:
             return {"status": "ok", "message": f"Deleted expense ID {expense_id}"}
         else:
             return {"status": "error", "message": f"Expense ID {expense_id} not found"}
 
+_PAGE_SIZE = 1000
+
 @mcp.tool()
-def list_expenses(start_date, end_date, category=None, payment_method=None, location=None, tag=None):
-    '''List expense entries within date range with optional filters.'''
-    with sqlite3.connect(DB_PATH) as c:
+def list_expenses(start_date, end_date, category=None, payment_method=None, location=None, tag=None,
+                  limit=_PAGE_SIZE, offset=0, before_date=None, before_id=None):
+    '''List expense entries within date range with optional filters, newest first, one page at a time.'''
+    if (before_date is None) != (before_id is None):
+        return {"status": "error", "message": "before_date and before_id must be given together"}
+    # None means "use the default", like the other optional parameters
+    try:
+        limit = _PAGE_SIZE if limit is None else int(limit)
+        offset = 0 if offset is None else int(offset)
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "limit and offset must be whole numbers"}
+    
+    with _db_lock:
+        c = CONN
         query = """
             SELECT id, date, amount, category, subcategory, note, payment_method, location, tags
             FROM expenses
@@ -154,31 +314,37 @@ def list_expenses(start_date, end_date, category=None, payment_method=None, loca
             query += " AND location LIKE ?"
             params.append(f"%{location}%")
         if tag:
-            query += " AND tags LIKE ?"
-            params.append(f"%{tag}%")
+            query += " AND id IN (SELECT expense_id FROM expense_tags WHERE tag = ?)"
+            params.append(tag.strip())
+        if before_date is not None:
+            # Keyset pagination: continue after the last row of the previous page
+            query += " AND (date, id) < (?, ?)"
+            params.extend([before_date, before_id])
             
-        query += " ORDER BY date DESC, id DESC"
+        query += " ORDER BY date DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
         
         cur = c.execute(query, params)
-        cols = [d[0] for d in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
+        return [dict(r) for r in cur]
 
 # ============== INCOME TRACKING ==============
 
 @mcp.tool()
 def add_income(date, amount, source, category="salary", note=""):
     '''Add income entry to track earnings.'''
-    with sqlite3.connect(DB_PATH) as c:
-        cur = c.execute(
-            "INSERT INTO income(date, amount, source, category, note) VALUES (?,?,?,?,?)",
+    with _db_lock:
+        c = CONN
+        [row] = c.execute(
+            "INSERT INTO income(date, amount, source, category, note) VALUES (?,?,?,?,?) RETURNING id",
             (date, amount, source, category, note)
-        )
-        return {"status": "ok", "id": cur.lastrowid, "message": f"Added income of ${amount} from {source}"}
+        ).fetchall()
+        return {"status": "ok", "id": row["id"], "message": f"Added income of ${amount} from {source}"}
 
 @mcp.tool()
 def list_income(start_date, end_date, source=None):
     '''List income entries within date range.'''
-    with sqlite3.connect(DB_PATH) as c:
+    with _db_lock:
+        c = CONN
         query = "SELECT * FROM income WHERE date BETWEEN ? AND ?"
         params = [start_date, end_date]
         
@@ -189,8 +355,7 @@ def list_income(start_date, end_date, source=None):
         query += " ORDER BY date DESC"
         
         cur = c.execute(query, params)
-        cols = [d[0] for d in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
+        return [dict(r) for r in cur]
 
 # ============== RECURRING EXPENSES ==============
 
@@ -201,7 +366,8 @@ def add_recurring_expense(name, amount, category, frequency, next_due_date, subc
     if frequency not in valid_frequencies:
         return {"status": "error", "message": f"Frequency must be one of: {', '.join(valid_frequencies)}"}
     
-    with sqlite3.connect(DB_PATH) as c:
+    with _db_lock:
+        c = CONN
         cur = c.execute(
             """INSERT INTO recurring_expenses(name, amount, category, subcategory, note, frequency, next_due_date) 
                VALUES (?,?,?,?,?,?,?)""",
@@ -212,194 +378,226 @@ def add_recurring_expense(name, amount, category, frequency, next_due_date, subc
 @mcp.tool()
 def list_recurring_expenses(active_only=True):
     '''List all recurring expense templates.'''
-    with sqlite3.connect(DB_PATH) as c:
-        query = "SELECT * FROM recurring_expenses"
+    with _db_lock:
+        c = CONN
+        query = """
+            SELECT id, name, amount, category, subcategory, note, frequency, next_due_date, active
+            FROM recurring_expenses
+        """
         if active_only:
             query += " WHERE active = 1"
         query += " ORDER BY next_due_date ASC"
         
         cur = c.execute(query)
-        cols = [d[0] for d in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
+        return [dict(r) for r in cur]
 
 @mcp.tool()
 def process_due_recurring_expenses(date=None):
     '''Process recurring expenses that are due and create actual expense entries.'''
     if date is None:
-        date = datetime.now().strftime("%Y-%m-%d")
+        date = _today_str()
     
-    with sqlite3.connect(DB_PATH) as c:
-        # Find due recurring expenses
-        due_expenses = c.execute(
-            "SELECT * FROM recurring_expenses WHERE next_due_date <= ? AND active = 1",
-            (date,)
-        ).fetchall()
-        
-        processed = []
-        for expense in due_expenses:
-            expense_id, name, amount, category, subcategory, note, frequency, next_due_date, active, created_at = expense
+    with _db_lock:
+        c = CONN
+        with _transaction(c):
+            due_filter = "next_due_date <= ? AND active = 1"
+            processed = [
+                {"name": name, "amount": amount, "category": category}
+                for name, amount, category in c.execute(
+                    f"SELECT name, amount, category FROM recurring_expenses WHERE {due_filter}",
+                    (date,)
+                )
+            ]
             
-            # Create the actual expense entry
+            # Create the actual expense entries
             c.execute(
-                """INSERT INTO expenses(date, amount, category, subcategory, note, recurring_id) 
-                   VALUES (?,?,?,?,?,?)""",
-                (date, amount, category, subcategory, f"[Recurring: {name}] {note}", expense_id)
+                f"""INSERT INTO expenses(date, amount, category, subcategory, note, recurring_id)
+                    SELECT ?, amount, category, subcategory, '[Recurring: ' || name || '] ' || COALESCE(note, ''), id
+                    FROM recurring_expenses WHERE {due_filter}""",
+                (date, date)
             )
             
-            # Calculate next due date
-            next_date = datetime.strptime(next_due_date, "%Y-%m-%d")
-            if frequency == 'daily':
-                next_date += timedelta(days=1)
-            elif frequency == 'weekly':
-                next_date += timedelta(weeks=1)
-            elif frequency == 'monthly':
-                if next_date.month == 12:
-                    next_date = next_date.replace(year=next_date.year + 1, month=1)
-                else:
-                    next_date = next_date.replace(month=next_date.month + 1)
-            elif frequency == 'yearly':
-                next_date = next_date.replace(year=next_date.year + 1)
-            
-            # Update next due date
+            # Advance next due dates. date() would overflow a day-of-month that the target
+            # month lacks (Jan 31 + 1 month = Mar 2), so clamp to the target month's last day.
             c.execute(
-                "UPDATE recurring_expenses SET next_due_date = ? WHERE id = ?",
-                (next_date.strftime("%Y-%m-%d"), expense_id)
+                f"""UPDATE recurring_expenses SET next_due_date = CASE frequency
+                        WHEN 'daily' THEN date(next_due_date, '+1 day')
+                        WHEN 'weekly' THEN date(next_due_date, '+7 days')
+                        WHEN 'monthly' THEN CASE
+                            WHEN strftime('%d', date(next_due_date, '+1 month')) <> strftime('%d', next_due_date)
+                            THEN date(next_due_date, 'start of month', '+2 months', '-1 day')
+                            ELSE date(next_due_date, '+1 month')
+                        END
+                        WHEN 'yearly' THEN CASE
+                            WHEN strftime('%d', date(next_due_date, '+1 year')) <> strftime('%d', next_due_date)
+                            THEN date(next_due_date, 'start of month', '+1 year', '+1 month', '-1 day')
+                            ELSE date(next_due_date, '+1 year')
+                        END
+                        ELSE next_due_date
+                    END
+                    WHERE {due_filter}""",
+                (date,)
             )
-            
-            processed.append({"name": name, "amount": amount, "category": category})
         
         return {"status": "ok", "processed": processed, "count": len(processed)}
 
 # ============== ADVANCED ANALYTICS ==============
 
+_DAY_OF_WEEK_SQL = """
+    CASE strftime('%w', date)
+        WHEN '0' THEN 'Sunday'
+        WHEN '1' THEN 'Monday'
+        WHEN '2' THEN 'Tuesday'
+        WHEN '3' THEN 'Wednesday'
+        WHEN '4' THEN 'Thursday'
+        WHEN '5' THEN 'Friday'
+        WHEN '6' THEN 'Saturday'
+    END"""
+
+def _summarize_sql(period, with_category):
+    query = f"""
+        SELECT {period} as period, SUM(amount) as total_amount, COUNT(*) as count
+        FROM expenses WHERE date BETWEEN ? AND ?
+    """
+    if with_category:
+        query += " AND category = ?"
+    return query + " GROUP BY period ORDER BY total_amount DESC"
+
+# group_by -> (query without category filter, query with category filter),
+# built once so every call hands SQLite identical statement text.
+_SUMMARIZE_SQL = {
+    group_by: (_summarize_sql(period, False), _summarize_sql(period, True))
+    for group_by, period in {
+        'category': 'category',
+        'subcategory': 'subcategory',
+        'payment_method': 'payment_method',
+        'location': 'location',
+        'month': "strftime('%Y-%m', date)",
+        'day_of_week': _DAY_OF_WEEK_SQL,
+    }.items()
+}
+
 @mcp.tool()
 def summarize(start_date, end_date, category=None, group_by="category"):
     '''Summarize expenses with flexible grouping options.'''
-    valid_groups = ['category', 'subcategory', 'payment_method', 'location', 'month', 'day_of_week']
-    if group_by not in valid_groups:
-        return {"status": "error", "message": f"group_by must be one of: {', '.join(valid_groups)}"}
+    if group_by not in _SUMMARIZE_SQL:
+        return {"status": "error", "message": f"group_by must be one of: {', '.join(_SUMMARIZE_SQL)}"}
     
-    with sqlite3.connect(DB_PATH) as c:
-        if group_by == 'month':
-            query = """
-                SELECT strftime('%Y-%m', date) as period, SUM(amount) as total_amount, COUNT(*) as count
-                FROM expenses WHERE date BETWEEN ? AND ?
-            """
-        elif group_by == 'day_of_week':
-            query = """
-                SELECT 
-                    CASE strftime('%w', date)
-                        WHEN '0' THEN 'Sunday'
-                        WHEN '1' THEN 'Monday'
-                        WHEN '2' THEN 'Tuesday'
-                        WHEN '3' THEN 'Wednesday'
-                        WHEN '4' THEN 'Thursday'
-                        WHEN '5' THEN 'Friday'
-                        WHEN '6' THEN 'Saturday'
-                    END as period,
-                    SUM(amount) as total_amount,
-                    COUNT(*) as count
-                FROM expenses WHERE date BETWEEN ? AND ?
-            """
-        else:
-            query = f"""
-                SELECT {group_by} as period, SUM(amount) as total_amount, COUNT(*) as count
-                FROM expenses WHERE date BETWEEN ? AND ?
-            """
-        
-        params = [start_date, end_date]
-        
+    no_cat_sql, with_cat_sql = _SUMMARIZE_SQL[group_by]
+    with _db_lock:
+        c = CONN
         if category:
-            query += " AND category = ?"
-            params.append(category)
-        
-        if group_by in ['month', 'day_of_week']:
-            query += " GROUP BY period ORDER BY total_amount DESC"
+            cur = c.execute(with_cat_sql, (start_date, end_date, category))
         else:
-            query += f" GROUP BY {group_by} ORDER BY total_amount DESC"
+            cur = c.execute(no_cat_sql, (start_date, end_date))
         
-        cur = c.execute(query, params)
-        cols = [d[0] for d in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
+        return [dict(r) for r in cur]
 
 @mcp.tool()
 def get_spending_trends(months=6):
     '''Analyze spending trends over the last N months.'''
-    with sqlite3.connect(DB_PATH) as c:
-        query = """
+    with _db_lock:
+        c = CONN
+        # Totals stay REAL columns; a JSON round trip would cut them to 15 significant digits
+        cur = c.execute("""
             SELECT 
                 strftime('%Y-%m', date) as month,
                 category,
                 SUM(amount) as total_amount
             FROM expenses 
-            WHERE date >= date('now', '-{} months')
-            GROUP BY strftime('%Y-%m', date), category
+            WHERE date >= date('now', ?)
+            GROUP BY month, category
             ORDER BY month DESC, total_amount DESC
-        """.format(months)
-        
-        cur = c.execute(query)
-        results = cur.fetchall()
+        """, ('-%d months' % int(months),))
         
-        # Organize by month
-        trends = defaultdict(list)
-        for month, category, amount in results:
-            trends[month].append({"category": category, "amount": amount})
-        
-        return dict(trends)
+        # Rows arrive sorted by month, so each month's list is built in order
+        trends = {}
+        for month, category, amount in cur:
+            trends.setdefault(month, []).append({"category": category, "amount": amount})
+        return trends
 
 @mcp.tool()
 def get_expense_statistics(start_date, end_date):
     '''Get comprehensive statistics for expenses in date range.'''
-    with sqlite3.connect(DB_PATH) as c:
-        # Basic stats
-        stats = c.execute("""
-            SELECT 
-                COUNT(*) as total_transactions,
-                SUM(amount) as total_spent,
-                AVG(amount) as avg_transaction,
-                MIN(amount) as min_transaction,
-                MAX(amount) as max_transaction
-            FROM expenses WHERE date BETWEEN ? AND ?
-        """, (start_date, end_date)).fetchone()
-        
-        # Top categories
-        top_categories = c.execute("""
-            SELECT category, SUM(amount) as total, COUNT(*) as count
-            FROM expenses WHERE date BETWEEN ? AND ?
-            GROUP BY category ORDER BY total DESC LIMIT 5
+    with _db_lock:
+        c = CONN
+        # Basic stats, distinct days and top categories from a single pass over the range.
+        # The stats row is repeated for each top category so totals stay REAL columns.
+        rows = c.execute("""
+            WITH base AS (
+                SELECT amount, category, date
+                FROM expenses WHERE date BETWEEN ? AND ?
+            ),
+            stats AS (
+                SELECT 
+                    COUNT(*) as total_transactions,
+                    SUM(amount) as total_spent,
+                    AVG(amount) as avg_transaction,
+                    MIN(amount) as min_transaction,
+                    MAX(amount) as max_transaction,
+                    COUNT(DISTINCT date) as days
+                FROM base
+            ),
+            top_categories AS (
+                SELECT category, SUM(amount) as total, COUNT(*) as count
+                FROM base GROUP BY category ORDER BY total DESC LIMIT 5
+            )
+            SELECT stats.*, top_categories.category, top_categories.total, top_categories.count
+            FROM stats LEFT JOIN top_categories
+            ORDER BY top_categories.total DESC
         """, (start_date, end_date)).fetchall()
-        
-        # Daily average
-        days_count = c.execute("""
-            SELECT COUNT(DISTINCT date) as days 
-            FROM expenses WHERE date BETWEEN ? AND ?
-        """, (start_date, end_date)).fetchone()[0]
-        
-        daily_avg = stats[1] / max(days_count, 1)  # Avoid division by zero
-        
-        return {
-            "total_transactions": stats[0],
-            "total_spent": stats[1],
-            "average_transaction": stats[2],
-            "min_transaction": stats[3],
-            "max_transaction": stats[4],
-            "daily_average": daily_avg,
-            "days_tracked": days_count,
-            "top_categories": [{"category": cat, "total": total, "count": count} 
-                             for cat, total, count in top_categories]
-        }
+    
+    stats = rows[0]
+    days_count = stats["days"]
+    daily_avg = (stats["total_spent"] or 0) / max(days_count, 1)  # Avoid division by zero
+    
+    return {
+        "total_transactions": stats["total_transactions"],
+        "total_spent": stats["total_spent"],
+        "average_transaction": stats["avg_transaction"],
+        "min_transaction": stats["min_transaction"],
+        "max_transaction": stats["max_transaction"],
+        "daily_average": daily_avg,
+        "days_tracked": days_count,
+        "top_categories": [{"category": row["category"], "total": row["total"], "count": row["count"]}
+                           for row in rows if row["category"] is not None]
+    }
 
 # ============== BUDGET MANAGEMENT ==============
 
+# path -> [st_mtime_ns, raw text, parsed JSON or _UNPARSED] for the JSON config files
+_file_cache = {}
+_UNPARSED = object()
+
+def _read_cached(path):
+    '''Return the cache entry for a config file, re-reading it only when its mtime changes.'''
+    mtime = os.stat(path).st_mtime_ns
+    cached = _file_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = [mtime, f.read(), _UNPARSED]
+        _file_cache[path] = cached
+    return cached
+
+def _read_text_cached(path):
+    '''Return the raw text of a config file.'''
+    return _read_cached(path)[1]
+
+def _read_json_cached(path):
+    '''Return the parsed JSON of a config file, parsing it once per change on disk.'''
+    cached = _read_cached(path)
+    if cached[2] is _UNPARSED:
+        cached[2] = json.loads(cached[1])
+    return cached[2]
+
 @mcp.tool()
 def set_budget(category, monthly_limit, start_date=None):
     '''Set or update budget limit for a category.'''
     if start_date is None:
-        start_date = datetime.now().replace(day=1).strftime("%Y-%m-%d")
+        start_date = _today_str()[:8] + "01"
     
     try:
-        with open(BUDGETS_PATH, 'r') as f:
-            budgets = json.load(f)
+        budgets = dict(_read_json_cached(BUDGETS_PATH))
     except FileNotFoundError:
         budgets = {}
     
@@ -408,8 +606,12 @@ def set_budget(category, monthly_limit, start_date=None):
         "start_date": start_date
     }
     
-    with open(BUDGETS_PATH, 'w') as f:
+    # Write to a temp file and swap it in so readers never see a partial file
+    tmp_path = BUDGETS_PATH + ".tmp"
+    with open(tmp_path, 'w') as f:
         json.dump(budgets, f, indent=2)
+    os.replace(tmp_path, BUDGETS_PATH)
+    _file_cache.pop(BUDGETS_PATH, None)
     
     return {"status": "ok", "message": f"Set budget for {category}: ${monthly_limit}/month"}
 
@@ -417,83 +619,108 @@ def set_budget(category, monthly_limit, start_date=None):
 def check_budget_status(month=None):
     '''Check current budget status for all categories.'''
     if month is None:
-        month = datetime.now().strftime("%Y-%m")
+        month = _today_str()[:7]
+    if _invalid_month(month):
+        return {"status": "error", "message": f"Month must be in YYYY-MM format, got {month!r}"}
     
     try:
-        with open(BUDGETS_PATH, 'r') as f:
-            budgets = json.load(f)
+        budgets = _read_json_cached(BUDGETS_PATH)
     except FileNotFoundError:
         return {"status": "error", "message": "No budgets set"}
     
-    start_date = f"{month}-01"
-    # Get last day of month
-    year, month_num = map(int, month.split('-'))
-    last_day = calendar.monthrange(year, month_num)[1]
-    end_date = f"{month}-{last_day:02d}"
+    # SQLite computes the month's end; the range is half-open: [start, start + 1 month)
+    month_start = f"{month}-01"
     
-    with sqlite3.connect(DB_PATH) as c:
-        status = []
-        for category, budget_info in budgets.items():
-            spent = c.execute(
-                "SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE category = ? AND date BETWEEN ? AND ?",
-                (category, start_date, end_date)
-            ).fetchone()[0]
-            
-            limit = budget_info['monthly_limit']
-            remaining = limit - spent
-            percent_used = (spent / limit) * 100 if limit > 0 else 0
-            
-            status.append({
-                "category": category,
-                "budget_limit": limit,
-                "spent": spent,
-                "remaining": remaining,
-                "percent_used": percent_used,
-                "over_budget": spent > limit
-            })
-        
-        return {"month": month, "budget_status": status}
+    placeholders = ",".join("?" * len(budgets))
+    with _db_lock:
+        c = CONN
+        totals = dict(c.execute(
+            f"""SELECT category, SUM(amount) FROM expenses
+                WHERE date >= ? AND date < date(?, '+1 month') AND category IN ({placeholders})
+                GROUP BY category""",
+            (month_start, month_start, *budgets)
+        ))
+    
+    status = []
+    for category, budget_info in budgets.items():
+        spent = totals.get(category, 0)
+        
+        limit = budget_info['monthly_limit']
+        remaining = limit - spent
+        percent_used = (spent / limit) * 100 if limit > 0 else 0
+        
+        status.append({
+            "category": category,
+            "budget_limit": limit,
+            "spent": spent,
+            "remaining": remaining,
+            "percent_used": percent_used,
+            "over_budget": spent > limit
+        })
+    
+    return {"month": month, "budget_status": status}
 
 # ============== SEARCH AND FILTERING ==============
 
+def _fts_query(text):
+    '''Turn free text into an FTS5 query that matches each word as a prefix.'''
+    # Terms made only of punctuation (e.g. "&") have no tokens and would match nothing
+    terms = [term for term in text.split() if any(ch.isalnum() for ch in term)]
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
 @mcp.tool()
-def search_expenses(query, start_date=None, end_date=None):
-    '''Search expenses by note, category, subcategory, location, or tags.'''
-    with sqlite3.connect(DB_PATH) as c:
+def search_expenses(query, start_date=None, end_date=None, limit=_PAGE_SIZE, offset=0, before_date=None, before_id=None):
+    '''Search expenses by note, category, subcategory, location, or tags, one page at a time.'''
+    if (before_date is None) != (before_id is None):
+        return {"status": "error", "message": "before_date and before_id must be given together"}
+    # None means "use the default", like the other optional parameters
+    try:
+        limit = _PAGE_SIZE if limit is None else int(limit)
+        offset = 0 if offset is None else int(offset)
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "limit and offset must be whole numbers"}
+    
+    with _db_lock:
+        c = CONN
         sql_query = """
             SELECT id, date, amount, category, subcategory, note, payment_method, location, tags
-            FROM expenses WHERE (
-                note LIKE ? OR 
-                category LIKE ? OR 
-                subcategory LIKE ? OR 
-                location LIKE ? OR 
-                tags LIKE ?
-            )
+            FROM expenses
         """
-        params = [f"%{query}%"] * 5
+        conditions = []
+        params = []
         
+        match = _fts_query(query)
+        if match:
+            conditions.append("id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)")
+            params.append(match)
         if start_date:
-            sql_query += " AND date >= ?"
+            conditions.append("date >= ?")
             params.append(start_date)
         if end_date:
-            sql_query += " AND date <= ?"
+            conditions.append("date <= ?")
             params.append(end_date)
+        if before_date is not None:
+            # Keyset pagination: continue after the last row of the previous page
+            conditions.append("(date, id) < (?, ?)")
+            params.extend([before_date, before_id])
         
-        sql_query += " ORDER BY date DESC"
+        if conditions:
+            sql_query += " WHERE " + " AND ".join(conditions)
+        sql_query += " ORDER BY date DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
         
         cur = c.execute(sql_query, params)
-        cols = [d[0] for d in cur.description]
-        return [dict(zip(cols, r)) for r in cur.fetchall()]
+        return [dict(r) for r in cur]
 
 @mcp.tool()
 def get_expense_by_id(expense_id):
     '''Get detailed information about a specific expense.'''
-    with sqlite3.connect(DB_PATH) as c:
+    with _db_lock:
+        c = CONN
         cur = c.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,))
         row = cur.fetchone()
         if row:
-            cols = [d[0] for d in cur.description]
-            return dict(zip(cols, row))
+            return dict(row)
         else:
             return {"status": "error", "message": f"Expense ID {expense_id} not found"}
 
@@ -505,25 +732,67 @@ def export_expenses_csv(start_date, end_date, filename=None):
     if filename is None:
         filename = f"expenses_{start_date}_to_{end_date}.csv"
     
-    with sqlite3.connect(DB_PATH) as c:
-        expenses = c.execute("""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(["Date", "Amount", "Category", "Subcategory", "Note", "Payment Method", "Location", "Tags"])
+    
+    with _db_lock:
+        c = CONN
+        cur = c.execute("""
             SELECT date, amount, category, subcategory, note, payment_method, location, tags
             FROM expenses WHERE date BETWEEN ? AND ?
             ORDER BY date ASC
-        """, (start_date, end_date)).fetchall()
-    
-    # Create CSV content
-    csv_content = "Date,Amount,Category,Subcategory,Note,Payment Method,Location,Tags\n"
-    for expense in expenses:
-        # Escape commas in text fields
-        row = [str(field).replace(',', ';') if field else '' for field in expense]
-        csv_content += ",".join(row) + "\n"
+        """, (start_date, end_date))
+        
+        # Stream rows straight from the cursor; csv.writer handles quoting
+        record_count = 0
+        for expense in cur:
+            writer.writerow(expense)
+            record_count += 1
     
     return {
         "status": "ok",
         "filename": filename,
-        "content": csv_content,
-        "record_count": len(expenses)
+        "content": buf.getvalue(),
+        "record_count": record_count
+    }
+
+@mcp.tool()
+def add_expenses_bulk(rows: list[dict]):
+    '''Add many expense entries in one transaction; each row takes the same fields as add_expense.'''
+    try:
+        values = [
+            (row["date"], row["amount"], row["category"], row.get("subcategory", ""), row.get("note", ""),
+             row.get("payment_method", ""), row.get("location", ""), row.get("tags", ""))
+            for row in rows
+        ]
+    except KeyError as e:
+        return {"status": "error", "message": f"Every expense needs date, amount and category (missing {e})"}
+    if not values:
+        return {"status": "error", "message": "No expenses to add"}
+    
+    with _db_lock:
+        c = CONN
+        with _transaction(c):
+            c.executemany(
+                """INSERT INTO expenses(date, amount, category, subcategory, note, payment_method, location, tags) 
+                   VALUES (?,?,?,?,?,?,?,?)""",
+                values
+            )
+            # AUTOINCREMENT ids inside one write transaction are consecutive
+            last_id = c.execute("SELECT last_insert_rowid()").fetchone()[0]
+            first_id = last_id - len(values) + 1
+            c.executemany(
+                "INSERT OR IGNORE INTO expense_tags(expense_id, tag) VALUES (?, ?)",
+                [(first_id + i, tag) for i, value in enumerate(values) for tag in _split_tags(value[7])]
+            )
+    
+    return {
+        "status": "ok",
+        "first_id": first_id,
+        "last_id": last_id,
+        "count": len(values),
+        "message": f"Added {len(values)} expenses"
     }
 
 # ============== FINANCIAL HEALTH ==============
@@ -532,22 +801,22 @@ def export_expenses_csv(start_date, end_date, filename=None):
 def calculate_net_worth(month=None):
     '''Calculate net worth (income - expenses) for a given month.'''
     if month is None:
-        month = datetime.now().strftime("%Y-%m")
+        month = _today_str()[:7]
+    if _invalid_month(month):
+        return {"status": "error", "message": f"Month must be in YYYY-MM format, got {month!r}"}
     
-    start_date = f"{month}-01"
-    year, month_num = map(int, month.split('-'))
-    last_day = calendar.monthrange(year, month_num)[1]
-    end_date = f"{month}-{last_day:02d}"
+    month_start = f"{month}-01"
     
-    with sqlite3.connect(DB_PATH) as c:
+    with _db_lock:
+        c = CONN
         total_income = c.execute(
-            "SELECT COALESCE(SUM(amount), 0) FROM income WHERE date BETWEEN ? AND ?",
-            (start_date, end_date)
+            "SELECT COALESCE(SUM(amount), 0) FROM income WHERE date >= ? AND date < date(?, '+1 month')",
+            (month_start, month_start)
         ).fetchone()[0]
         
         total_expenses = c.execute(
-            "SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE date BETWEEN ? AND ?",
-            (start_date, end_date)
+            "SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE date >= ? AND date < date(?, '+1 month')",
+            (month_start, month_start)
         ).fetchone()[0]
         
         net_worth = total_income - total_expenses
@@ -567,8 +836,7 @@ def calculate_net_worth(month=None):
 def categories():
     '''Read expense categories configuration.'''
     try:
-        with open(CATEGORIES_PATH, "r", encoding="utf-8") as f:
-            return f.read()
+        return _read_text_cached(CATEGORIES_PATH)
     except FileNotFoundError:
         # Return default categories if file doesn't exist
         default_categories = {
@@ -588,8 +856,7 @@ def categories():
 def budgets():
     '''Read budget configuration.'''
     try:
-        with open(BUDGETS_PATH, "r", encoding="utf-8") as f:
-            return f.read()
+        return _read_text_cached(BUDGETS_PATH)
     except FileNotFoundError:
         return json.dumps({}, indent=2)
 